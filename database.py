@@ -1,3 +1,23 @@
+import os
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from dotenv import load_dotenv
 from prisma import Prisma
 
-db = Prisma()
+load_dotenv()
+
+def pooled_database_url(url: str | None) -> str | None:
+    """
+    Adds Prisma connection-pool settings to DATABASE_URL unless it already sets them.
+    DB_CONNECTION_LIMIT / DB_POOL_TIMEOUT override the defaults.
+    """
+    if not url:
+        return url
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.setdefault("connection_limit", os.getenv("DB_CONNECTION_LIMIT", "20"))
+    query.setdefault("pool_timeout", os.getenv("DB_POOL_TIMEOUT", "30"))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+DATABASE_URL = pooled_database_url(os.getenv("DATABASE_URL"))
+
+db = Prisma(datasource={"url": DATABASE_URL}) if DATABASE_URL else Prisma()
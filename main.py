@@ -1,4 +1,5 @@
 import os
+import logging
 import warnings
 from dotenv import load_dotenv
 
@@ -6,17 +7,43 @@ from dotenv import load_dotenv
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 warnings.filterwarnings("ignore", message=".*The `__fields__` attribute is deprecated.*")
 
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from database import db
 from routers import chat, emergency
+from routers.web_helpers import close_web_clients
 
 load_dotenv()
 
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+# Modules that log (rather than print) are routed through here; LOG_LEVEL=DEBUG shows per-URL scrape detail
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
+
+class NonStreamingGZipMiddleware(GZipMiddleware):
+    """
+    GZip for regular responses only. Streamed chat replies are passed through
+    untouched, since gzip would hold tokens back until its buffer fills.
+    """
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/message"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 app = FastAPI(
     title="Chatbot API",
     description="Chatbot API for AI-powered PDF analysis and Q&A",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 # CORS Setup
@@ -32,12 +59,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(NonStreamingGZipMiddleware, minimum_size=500, compresslevel=1)
+
 # Include Routers
 app.include_router(chat.router)
 app.include_router(emergency.router)
 
 @app.on_event("startup")
 async def startup():
+    # All blocking work (Chroma, embedding cache, page parsing, DDG) goes through run_in_threadpool, so size it per deployment
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
     print("✅ FASTAPI STARTUP: Connecting Prisma...")
     await db.connect()
     print("✅ FASTAPI STARTUP: Prisma Connected!")
@@ -46,6 +77,7 @@ async def startup():
 async def shutdown():
     print("🔻 FASTAPI SHUTDOWN: Disconnecting Prisma...")
     await db.disconnect()
+    await close_web_clients()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,4 @@
+-- AlterTable
+-- IF NOT EXISTS: "summary" was added to the schema without a migration, so it may already exist
+ALTER TABLE "ChatSession" ADD COLUMN IF NOT EXISTS "summary" TEXT,
+ADD COLUMN IF NOT EXISTS "summarizedCount" INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,128 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+log = logging.getLogger(__name__)
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with a per-entry TTL.
+    Keys are tuples whose first element is the scope (e.g. chat_id), so every
+    entry for one scope can be dropped with invalidate_prefix().
+    """
+
+    def __init__(self, max_size: int = 512, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_prefix(self, prefix: Hashable):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == prefix]:
+                del self._entries[key]
+
+
+class RedisCache:
+    """
+    Optional Redis-backed JSON cache, shared across workers and restarts.
+    Every call degrades to a miss (or a no-op) when REDIS_URL isn't set,
+    the redis package is missing, or Redis errors.
+    """
+
+    def __init__(self, url: Optional[str]):
+        self._redis = aioredis.from_url(url) if url and aioredis is not None else None
+
+    async def get(self, key: str) -> Optional[Any]:
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(key)
+            return json.loads(raw) if raw is not None else None
+        except Exception as e:
+            log.warning("Redis get failed, bypassing cache: %s", e)
+            return None
+
+    async def set(self, key: str, value: Any, ttl_seconds: int):
+        if self._redis is None:
+            return
+        try:
+            await self._redis.setex(key, ttl_seconds, json.dumps(value))
+        except Exception as e:
+            log.warning("Redis set failed, bypassing cache: %s", e)
+
+    async def aclose(self):
+        """Drops pooled connections; new ones are opened (on the current loop) by the next call."""
+        if self._redis is None:
+            return
+        try:
+            close = getattr(self._redis, "aclose", None) or self._redis.close
+            await close()
+        except Exception as e:
+            log.warning("Redis close failed: %s", e)
+
+
+class DiskCache:
+    """
+    Optional on-disk cache (diskcache/SQLite) with the same interface as
+    RedisCache, so a single process keeps its cache across restarts without
+    running Redis. A no-op when the directory isn't set or diskcache is missing.
+    """
+
+    def __init__(self, directory: Optional[str], size_limit: int = 200_000_000):
+        self._cache = diskcache.Cache(directory, size_limit=size_limit) if directory and diskcache is not None else None
+
+    async def get(self, key: str) -> Optional[Any]:
+        if self._cache is None:
+            return None
+        try:
+            return await run_in_threadpool(self._cache.get, key)
+        except Exception as e:
+            log.warning("Disk cache get failed, bypassing cache: %s", e)
+            return None
+
+    async def set(self, key: str, value: Any, ttl_seconds: int):
+        if self._cache is None:
+            return
+        try:
+            await run_in_threadpool(self._cache.set, key, value, expire=ttl_seconds)
+        except Exception as e:
+            log.warning("Disk cache set failed, bypassing cache: %s", e)
+
+    async def aclose(self):
+        """Nothing loop-bound to release; kept for parity with RedisCache."""
@@ -1,22 +1,37 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, UploadFile, File, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import os
-import shutil
-import tempfile
+import asyncio
+import aiofiles
+import aiofiles.tempfile
+import hashlib
+import importlib.util
+import logging
+import re
+from starlette.concurrency import run_in_threadpool
 from database import db
-from langchain_cohere import ChatCohere, CohereEmbeddings
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.documents import Document
 from langchain_chroma import Chroma
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-import traceback
-import chromadb
 import chromadb
+import requests
+from requests.adapters import HTTPAdapter
+try:
+    import httpx
+except ImportError:
+    httpx = None
+import fitz  # PyMuPDF
 from .tools import WebSearchTool, EmergencyCallTool, EmergencySmsTool
+from .cache import QueryCache
+from .web_helpers import route_query
+from .vector_index import LocalVectorIndex
+from .semantic_cache import SemanticResponseCache, is_crisis_message
 from langchain_core.messages import ToolMessage
-import json
+
+log = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
@@ -42,13 +57,84 @@ from .services import llm, embeddings
 CHROMA_API_KEY = os.getenv("CHROMA_API_KEY")
 CHROMA_TENANT = os.getenv("CHROMA_TENANT") 
 CHROMA_DATABASE = os.getenv("CHROMA_DATABASE")
+UPLOAD_CHUNK_SIZE = 1 << 20
+CHROMA_BATCH_SIZE = 128
+EMBED_BATCH_SIZE = 96  # Cohere's max texts per embed call
+EMBED_CONCURRENCY = 4  # Cohere embed calls in flight at once, so big PDFs don't trip rate limits
+CHROMA_POOL_SIZE = 64
+CACHED_REPLY_CHUNK = 64
+SUMMARY_MIN_DELTA = 4
+# Sent when the model still wants tools after the last allowed round
+TOOL_LIMIT_REPLY = "Sorry, I couldn't finish looking that up. Please try asking again."
+
+# RAG tuning: MMR over the top RAG_FETCH_K hits, drop weak matches, cap each excerpt
+RAG_FETCH_K = 8
+RAG_MIN_SCORE = 0.35
+RAG_EXCERPT_CHARS = 400
+# A hit this close (cosine) means the PDF likely answers the query, so web search isn't offered
+RAG_STRONG_SCORE = 0.75
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+# System prompts
+GENERAL_SYSTEM = "You are a helpful AI assistant."
+# Prompts are kept flush-left: source indentation inside the literal would be sent to the model on every call
+MEDGAMMA_SYSTEM = """You are MedGamma, an advanced AI health assistant.
+Your goal is to provide helpful, accurate, and empathetic health information.
+ALWAYS include a disclaimer: "I am an AI, not a doctor. Please consult a professional for medical advice."
+
+CRITICAL INSTRUCTION:
+You have access to tools for Emergency situations and Web Search.
+
+1. **Emergency**: If the user expresses CLEAR INTENT of SUICIDE ("I want to kill myself") or IMMEDIATE LIFE-THREAT ("I am bleeding out"),
+   you MUST call the `EmergencyCallTool`.
+   If they express self-harm ("I might cut myself") but not immediate death, call `EmergencySmsTool`.
+   If they are just stressed, anxious, or down, DO NOT call any tool. Provide support.
+
+2. **Information**: If the user asks about current events, news, or facts you don't know, call `WebSearchTool`.
+
+Keep your answers concise, professional, and supportive.
+"""
+SUMMARY_PROMPT = """Summarize the following conversation concisely, retaining key facts and context.
+Merge the new messages into the existing summary and return one unified summary.
+
+Existing summary:
+{summary}
+
+New messages:
+{messages}
+
+Summary:"""
+
+def widen_chroma_pool(client, pool_size: int):
+    """
+    Enlarges the hosted Chroma client's HTTP connection pool so bursts of
+    queries reuse keep-alive connections instead of new TLS handshakes.
+    Handles both the requests- and httpx-based chromadb clients; both retry failed connections.
+    """
+    server = getattr(client, "_server", None)
+    session = getattr(server, "_session", None)
+    if isinstance(session, requests.Session):
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    elif httpx is not None and isinstance(session, httpx.Client):
+        # Multiplex over HTTP/2 when h2 is installed; retry failed connects instead of erroring the turn
+        transport = httpx.HTTPTransport(
+            http2=importlib.util.find_spec("h2") is not None,
+            retries=2,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        server._session = httpx.Client(headers=session.headers, timeout=session.timeout, transport=transport)
+        session.close()
+    else:
+        log.warning("Unknown Chroma HTTP session, keeping default pool")
 
 # Initialize Chroma Client with Auth
 # Note: For hosted Chroma, we use HttpClient. If local, standard Client.
 # Based on env vars presence, we assume hosted if keys are present.
 try:
     if CHROMA_API_KEY and CHROMA_TENANT and CHROMA_DATABASE:
-        print("🔌 Connecting to Hosted ChromaDB...")
+        log.info("Connecting to hosted ChromaDB...")
         chroma_client = chromadb.HttpClient(
             ssl=True,
             host='api.trychroma.com',
@@ -58,8 +144,9 @@ try:
                 'x-chroma-token': CHROMA_API_KEY
             }
         )
+        widen_chroma_pool(chroma_client, CHROMA_POOL_SIZE)
     else:
-        print("📂 Using Local ChromaDB...")
+        log.info("Using local ChromaDB...")
         # Fallback to local persistent storage usually
         chroma_client = chromadb.PersistentClient(path="./chroma_db")
 
@@ -69,57 +156,317 @@ try:
         collection_name="chatbot_docs",
         embedding_function=embeddings,
     )
+
+    # Replies to stateless prompts, reused for near-duplicate questions
+    response_cache = SemanticResponseCache(
+        Chroma(
+            client=chroma_client,
+            collection_name="response_cache",
+            embedding_function=embeddings,
+        )
+    )
 except Exception as e:
-    print(f"🔥 Error connecting to ChromaDB: {e}")
+    log.error("Error connecting to ChromaDB: %s", e)
     vector_store = None
+    response_cache = None
+
+# Top-k RAG results per (chat_id, normalized message hash); dropped when the chat gets a new PDF
+rag_cache = QueryCache(max_size=1024, ttl_seconds=300)
+
+# In-process FAISS mirror of each chat's chunks, so retrieval skips the Chroma round-trip.
+# Reloaded from Chroma after a minute, so uploads handled by another worker show up.
+local_index = LocalVectorIndex(max_chats=256, ttl_seconds=60)
+embed_semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+# Strong references to fire-and-forget tasks; asyncio only keeps weak ones
+background_jobs = set()
 
 
 # --- Helper Functions ---
+def chunk_id(chat_id: str, chunk: Document) -> str:
+    """Stable per-chat ID for a chunk, so re-uploads upsert instead of duplicating."""
+    digest = hashlib.blake2b(chunk.page_content.encode(), digest_size=16).hexdigest()
+    return f"{chat_id}:{digest}"
+
+def find_indexed_ids(ids: List[str]) -> set:
+    """Which of the given chunk IDs Chroma already stores. Blocking."""
+    found = set()
+    for i in range(0, len(ids), CHROMA_BATCH_SIZE):
+        found.update(vector_store.get(ids=ids[i:i + CHROMA_BATCH_SIZE], include=[])["ids"])
+    return found
+
+async def index_chunks(chat_id: str, chunks: List[Document]) -> int:
+    """
+    Embeds and stores the chunks not already in Chroma, then drops the chat's
+    local index so the next search reloads it. Returns how many were added.
+    """
+    # Identical chunks share an ID and Chroma rejects duplicate IDs within one call
+    unique_chunks = {chunk_id(chat_id, chunk): chunk for chunk in chunks}
+
+    # Skip chunks already stored for this chat (re-uploads), so they aren't embedded again
+    all_ids = list(unique_chunks)
+    for existing_id in await run_in_threadpool(find_indexed_ids, all_ids):
+        unique_chunks.pop(existing_id, None)
+
+    ids = list(unique_chunks)
+    docs = list(unique_chunks.values())
+    if len(ids) < len(all_ids):
+        log.info("Skipping %d chunks already indexed for chat %s", len(all_ids) - len(ids), chat_id)
+    if not docs:
+        return 0
+
+    # Embed in Cohere-sized batches concurrently, then write the vectors straight to the
+    # collection instead of letting the LangChain wrapper embed again on insert
+    texts = [doc.page_content for doc in docs]
+    metadatas = [doc.metadata for doc in docs]
+    async def embed_batch(batch: List[str]) -> List[List[float]]:
+        async with embed_semaphore:
+            return await embeddings.aembed_documents(batch)
+
+    batches = await asyncio.gather(*[
+        embed_batch(texts[i:i + EMBED_BATCH_SIZE])
+        for i in range(0, len(texts), EMBED_BATCH_SIZE)
+    ])
+    vectors = [vector for batch in batches for vector in batch]
+
+    # Upsert batches are independent (distinct IDs), so send them concurrently over the pooled client
+    await asyncio.gather(*[
+        run_in_threadpool(
+            vector_store._collection.upsert,
+            ids=ids[i:i + CHROMA_BATCH_SIZE],
+            embeddings=vectors[i:i + CHROMA_BATCH_SIZE],
+            documents=texts[i:i + CHROMA_BATCH_SIZE],
+            metadatas=metadatas[i:i + CHROMA_BATCH_SIZE],
+        )
+        for i in range(0, len(ids), CHROMA_BATCH_SIZE)
+    ])
+
+    # Appending to a mirror that a concurrent search may be hydrating can double or drop chunks,
+    # so reload it from Chroma (which now has every chunk) instead
+    local_index.invalidate(chat_id)
+    return len(docs)
+
+def load_local_index(chat_id: str):
+    """Hydrates the chat's local FAISS index from the vectors stored in Chroma."""
+    data = vector_store.get(where={"chat_id": chat_id}, include=["embeddings", "documents", "metadatas"])
+    documents = [
+        Document(page_content=text, metadata=metadata or {})
+        for text, metadata in zip(data["documents"], data["metadatas"])
+    ]
+    local_index.load(chat_id, data["embeddings"], documents)
+    log.debug("Loaded %d chunks into local index for chat %s", len(documents), chat_id)
+
+async def ensure_local_index(chat_id: str) -> bool:
+    """Loads the chat's local index if it's cold or past its TTL. False if there's no usable index."""
+    if not local_index.available:
+        return False
+    if local_index.is_loaded(chat_id):
+        return True
+    try:
+        await run_in_threadpool(load_local_index, chat_id)
+        return True
+    except Exception as e:
+        log.warning("Loading local index failed, querying Chroma directly: %s", e)
+        local_index.invalidate(chat_id)
+        return False
+
+async def search_chunks(chat_id: str, query: str, k: int = 3) -> List[Tuple[Document, float]]:
+    """
+    Top-k (chunk, cosine similarity) pairs for the chat, dropping hits below RAG_MIN_SCORE.
+    Served from the local FAISS index, loaded from Chroma while the query is embedded. A freshly
+    loaded empty index (a chat without a PDF) is trusted until its TTL lapses, so plain chat turns
+    cost no extra Chroma query. Chroma is only searched directly, with the same query vector,
+    when the index can't be loaded.
+    """
+    query_vector, indexed = await asyncio.gather(
+        embeddings.aembed_query(query),
+        ensure_local_index(chat_id),
+    )
+    if indexed:
+        return await run_in_threadpool(local_index.search, chat_id, query_vector, k, RAG_FETCH_K, RAG_MIN_SCORE)
+
+    hits = await run_in_threadpool(
+        vector_store.similarity_search_by_vector_with_relevance_scores,
+        query_vector, k=k, filter={"chat_id": chat_id},
+    )
+    # The collection uses Chroma's default squared-L2 space; for unit vectors that's 2 - 2 * cosine
+    scored = [(doc, 1 - distance / 2) for doc, distance in hits]
+    return [(doc, score) for doc, score in scored if score >= RAG_MIN_SCORE]
+
+def trim_excerpt(text: str, limit: int = RAG_EXCERPT_CHARS) -> str:
+    """Cuts text to at most `limit` chars, ending on a sentence boundary where possible."""
+    if len(text) <= limit:
+        return text
+    excerpt = ""
+    for sentence in SENTENCE_END_RE.split(text):
+        if len(excerpt) + len(sentence) + 1 > limit:
+            break
+        excerpt = f"{excerpt} {sentence}" if excerpt else sentence
+    return excerpt or text[:limit]
+
+async def retrieve_context(chat_id: str, query: str) -> List[Tuple[Document, float]]:
+    """RAG lookup for the query as (chunk, score) pairs, served from rag_cache when possible."""
+    if not vector_store:
+        return []
+    try:
+        # Case and whitespace don't change the retrieved chunks enough to matter
+        normalized = " ".join(query.lower().split())
+        cache_key = (chat_id, hashlib.sha256(normalized.encode()).hexdigest())
+        results = rag_cache.get(cache_key)
+        if results is None:
+            results = await search_chunks(chat_id, query, 3)
+            rag_cache.put(cache_key, results)
+            log.debug("Retrieved %d chunks", len(results))
+        else:
+            log.debug("Reused %d cached chunks", len(results))
+        return results
+    except Exception as e:
+        log.warning("Vector search failed: %s", e)
+        return []
+
 async def update_summary(chat_id: str):
     """
     Background task to update the summary of the conversation.
-    Summarizes all messages except the last 5.
+    Rolling summary: folds the messages that left the last-5 window since the previous
+    run into the existing summary, once at least SUMMARY_MIN_DELTA of them have piled up.
     """
     try:
-        session = await db.chatsession.find_unique(
-            where={"id": chat_id},
-            include={"messages": True}
+        # COUNT + the session row are much cheaper than loading the history, and most turns don't need a new summary.
+        total, session = await asyncio.gather(
+            db.message.count(where={"chatSessionId": chat_id}),
+            db.chatsession.find_unique(where={"id": chat_id}),
         )
-        if not session or not session.messages:
+        if not session:
             return
 
-        sorted_messages = sorted(session.messages, key=lambda m: m.timestamp)
-        
-        if len(sorted_messages) <= 5:
+        cutoff = total - 5
+        if cutoff - session.summarizedCount < SUMMARY_MIN_DELTA:
             return
 
-        messages_to_summarize = sorted_messages[:-5]
-        
-        conversation_text = ""
-        for msg in messages_to_summarize:
-            conversation_text += f"{msg.sender}: {msg.text}\n"
+        new_messages = await db.message.find_many(
+            where={"chatSessionId": chat_id},
+            order={"timestamp": "asc"},
+            skip=session.summarizedCount,
+            take=cutoff - session.summarizedCount
+        )
+        if not new_messages:
+            return
 
-        summary_prompt = f"""
-        Summarize the following conversation concisely, retaining key facts and context.
-        
-        Conversation:
-        {conversation_text}
-        
-        Summary:
-        """
-        
-        response = llm.invoke(summary_prompt)
+        conversation_text = "".join(f"{msg.sender}: {msg.text}\n" for msg in new_messages)
+
+        summary_prompt = SUMMARY_PROMPT.format(summary=session.summary or "(none)", messages=conversation_text)
+        response = await llm.ainvoke(summary_prompt)
         new_summary = response.content
 
+        # One update, so the summary and its cutoff never disagree
         await db.chatsession.update(
             where={"id": chat_id},
-            data={"summary": new_summary}
+            data={"summary": new_summary, "summarizedCount": cutoff}
         )
-        print(f"✅ Summary updated for chat {chat_id}")
+        log.info("Summary updated for chat %s (%d new messages)", chat_id, len(new_messages))
+
+    except Exception as e:
+        log.exception("Error updating summary: %s", e)
+
+def load_pdf_chunks(tmp_path: str, chat_id: str, filename: str) -> List[Document]:
+    """
+    Parses the PDF into one Document per page and splits it into chunks.
+    CPU-bound, so call it from a threadpool.
+    """
+    # Strip form feeds so they don't inflate token counts.
+    # Opening by path lets MuPDF page the file in lazily rather than copying it onto the heap.
+    pdf = fitz.open(tmp_path)
+    try:
+        documents = [
+            Document(
+                page_content=page.get_text("text").replace("\f", ""),
+                metadata={"page": i, "chat_id": chat_id, "source": filename},
+            )
+            for i, page in enumerate(pdf)
+        ]
+    finally:
+        pdf.close()
 
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    return text_splitter.split_documents(documents)
+
+async def index_pdf(tmp_path: str, chat_id: str, filename: str):
+    """
+    Background task that parses and indexes an uploaded PDF, then posts
+    the outcome to the chat as a bot message.
+    """
+    try:
+        chunks = await run_in_threadpool(load_pdf_chunks, tmp_path, chat_id, filename)
+
+        if vector_store:
+            indexed = await index_chunks(chat_id, chunks)
+            rag_cache.invalidate_prefix(chat_id)
+            log.info("Indexed %d chunks for chat %s", indexed, chat_id)
+        else:
+            log.warning("Vector store not initialized, skipping indexing")
+
+        status_text = f"PDF '{filename}' uploaded and analyzed. I am ready to answer questions about it."
     except Exception as e:
-        print(f"🔥 Error updating summary: {e}")
-        traceback.print_exc()
+        log.exception("Error processing PDF: %s", e)
+        status_text = f"Sorry, I couldn't analyze PDF '{filename}': {e}"
+    finally:
+        # Clean up temp file
+        if os.path.exists(tmp_path):
+            await run_in_threadpool(os.remove, tmp_path)
+
+    try:
+        await db.message.create(
+            data={
+                "text": status_text,
+                "sender": "bot",
+                "chatSessionId": chat_id,
+            }
+        )
+    except Exception as e:
+        log.error("Error saving upload status: %s", e)
+
+async def save_bot_reply(chat_id: str, text: str):
+    """Persists the bot's reply."""
+    try:
+        await db.message.create(
+            data={
+                "text": text,
+                "sender": "bot",
+                "chatSessionId": chat_id
+            }
+        )
+    except Exception as e:
+        log.exception("Error saving bot reply: %s", e)
+
+async def save_reply_and_summarize(chat_id: str, text: str):
+    """Saves the bot's reply, then refreshes the summary so it includes it."""
+    await save_bot_reply(chat_id, text)
+    await update_summary(chat_id)
+
+async def cached_reply_generator(text: str):
+    """Streams a cached reply in small pieces, like a generated one."""
+    for i in range(0, len(text), CACHED_REPLY_CHUNK):
+        yield text[i:i + CACHED_REPLY_CHUNK]
+
+async def cache_reply(mode: str, message: str, text: str):
+    try:
+        await run_in_threadpool(response_cache.store_response, mode, message, text)
+    except Exception as e:
+        log.warning("Failed to cache reply: %s", e)
+
+async def run_tool(tool_map: dict, tool_call: dict) -> str:
+    """Runs one tool call from the model; tools that aren't bound get an empty result."""
+    tool = tool_map.get(tool_call["name"])
+    if tool is None:
+        return ""
+    return await tool.ainvoke(tool_call["args"])
+
+def spawn(coro) -> asyncio.Task:
+    """Runs coro as a fire-and-forget task, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
 
 # --- Routes ---
 
@@ -129,7 +476,7 @@ async def create_new_chat():
         session = await db.chatsession.create(data={})
         return {"uuid": session.id}
     except Exception as e:
-        traceback.print_exc()
+        log.exception("Error creating chat session: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{chat_id}", response_model=ChatHistoryResponse)
@@ -137,16 +484,15 @@ async def get_chat_history(chat_id: str):
     try:
         session = await db.chatsession.find_unique(
             where={"id": chat_id},
-            include={"messages": True},
+            include={"messages": {"order_by": {"timestamp": "asc"}}},
         )
 
         if not session:
             raise HTTPException(status_code=404, detail="Chat session not found")
 
-        sorted_messages = sorted(session.messages, key=lambda m: m.timestamp)
         msg_list = [
             Message(text=m.text, sender=m.sender, timestamp=m.timestamp.isoformat())
-            for m in sorted_messages
+            for m in session.messages
         ]
         
         return {"messages": msg_list, "summary": session.summary}
@@ -154,85 +500,76 @@ async def get_chat_history(chat_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        print("🔥 ERROR /chat/{chat_id}:", e)
+        log.error("Error in /chat/%s: %s", chat_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/{chat_id}/message")
 async def send_message(chat_id: str, body: UserMessage, background_tasks: BackgroundTasks):
     try:
         
-        # 1. Save User Message
-        await db.message.create(
-            data={
-                "text": body.message,
-                "sender": "user",
-                "chatSessionId": chat_id
-            }
-        )
-        
-
-        # 2. Retrieve Context (History + Summary + RAG)
-        session = await db.chatsession.find_unique(
-            where={"id": chat_id},
-            include={"messages": True}
+        # 1-2. Save the user message and load recent history in one nested write,
+        # concurrently with the RAG lookup. Only the last 5 messages are used, so let the DB sort and limit them.
+        session, context_hits = await asyncio.gather(
+            db.chatsession.update(
+                where={"id": chat_id},
+                data={"messages": {"create": {"text": body.message, "sender": "user"}}},
+                include={"messages": {"order_by": {"timestamp": "desc"}, "take": 5}}
+            ),
+            retrieve_context(chat_id, body.message),
         )
         if not session:
              raise HTTPException(status_code=404, detail="Chat session not found")
 
-        # RAG Retrieval
-        context_docs = []
-        if vector_store:
-            try:
-                results = vector_store.similarity_search(body.message, k=3, filter={"chat_id": chat_id})
-                context_docs = results
-                print(f"📚 Retrieved {len(results)} chunks from Chroma")
-            except Exception as e:
-                print(f"⚠️ Vector search failed: {e}")
-
+        context_docs = [doc for doc, _ in context_hits]
+        strong_rag_hit = any(score >= RAG_STRONG_SCORE for _, score in context_hits)
         rag_context = ""
         if context_docs:
-            rag_context = "\n\nRelevant Document Excerpts:\n" + "\n---\n".join([doc.page_content for doc in context_docs])
-
-        sorted_messages = sorted(session.messages, key=lambda m: m.timestamp)
-        recent_messages = sorted_messages[-5:] 
-        print("Context retrieved", recent_messages)
-        # 3. Available Tools
-        tools = [WebSearchTool, EmergencyCallTool, EmergencySmsTool]
+            rag_context = "\n\nRelevant Document Excerpts:\n" + "\n---\n".join([trim_excerpt(doc.page_content) for doc in context_docs])
+
+        recent_messages = list(reversed(session.messages))
+        history = recent_messages[:-1]
+        log.debug("Context retrieved: %s", recent_messages)
+
+        # A fresh chat with no summary or document hits has nothing chat-specific in the prompt,
+        # so a reply cached for a near-identical question is just as valid here.
+        # Never in medgamma mode: a cached reply would skip the emergency-tool check on health/crisis turns.
+        cacheable = (
+            response_cache is not None
+            and body.mode != "medgamma"
+            and not is_crisis_message(body.message)
+            and not history and not session.summary and not context_docs
+        )
+        if cacheable:
+            try:
+                cached = await run_in_threadpool(response_cache.lookup, body.mode, body.message)
+            except Exception as e:
+                log.warning("Response cache lookup failed: %s", e)
+                cached = None
+            if cached:
+                log.info("Serving cached reply")
+                # Saved and summarized after the response closes, the same as a generated reply
+                background_tasks.add_task(save_reply_and_summarize, chat_id, cached)
+                return StreamingResponse(cached_reply_generator(cached), media_type="text/plain")
+
+        # 3. Available Tools (small talk doesn't get the web tool)
+        tools = [EmergencyCallTool, EmergencySmsTool]
+        # Explicit web queries always get search; ambiguous ones only when the PDF doesn't already answer them
+        route = route_query(body.message)
+        if route == "WEB" or (route == "AUTO" and not strong_rag_hit):
+            tools.insert(0, WebSearchTool)
         llm_with_tools = llm.bind_tools(tools)
+        tool_map = {t.name: t for t in tools}
         
-        # Initialize context vars
-        web_context = "" # Kept if we want to manually inject, but mostly handled by tool now
-        print(f"Context Docs: {len(context_docs)}")
+        log.debug("Context docs: %d", len(context_docs))
         lc_messages = []
         
         # System Message
-        system_text = "You are a helpful AI assistant."
-        
-        if body.mode == "medgamma":
-            system_text = """You are MedGamma, an advanced AI health assistant. 
-            Your goal is to provide helpful, accurate, and empathetic health information.
-            ALWAYS include a disclaimer: "I am an AI, not a doctor. Please consult a professional for medical advice."
-            
-            CRITICAL INSTRUCTION:
-            You have access to tools for Emergency situations and Web Search.
-            
-            1. **Emergency**: If the user expresses CLEAR INTENT of SUICIDE ("I want to kill myself") or IMMEDIATE LIFE-THREAT ("I am bleeding out"), 
-               you MUST call the `EmergencyCallTool`.
-               If they express self-harm ("I might cut myself") but not immediate death, call `EmergencySmsTool`.
-               If they are just stressed, anxious, or down, DO NOT call any tool. Provide support.
-            
-            2. **Information**: If the user asks about current events, news, or facts you don't know, call `WebSearchTool`.
-            
-            Keep your answers concise, professional, and supportive.
-            """
-            
+        parts = [MEDGAMMA_SYSTEM if body.mode == "medgamma" else GENERAL_SYSTEM]
         if session.summary:
-            system_text += f"\n\nContext Summary of previous conversation:\n{session.summary}"
-        
-
-
+            parts.append(f"\n\nContext Summary of previous conversation:\n{session.summary}")
         if rag_context:
-            system_text += f"{rag_context}\n\nAnswer using the provided document excerpts if relevant."
+            parts.append(f"{rag_context}\n\nAnswer using the provided document excerpts if relevant.")
+        system_text = "".join(parts)
         
         lc_messages.append(SystemMessage(content=system_text))
         
@@ -244,95 +581,74 @@ async def send_message(chat_id: str, body: UserMessage, background_tasks: Backgr
         
         async def response_generator():
             try:
-                # Initial Invocation
-                # Note: Streaming with tools in LangChain can be tricky.
-                # We will loop: stream -> if tool_calls -> execute -> stream again
-                
-                final_answer_accumulated = ""
-                
-                # We need to manually manage the loop because `stream` essentially gives us chunks
-                # and if a chunk indicates a tool call, we need to gather the full call, execute, and recurse.
-                # Simplified approach: Use `invoke` for tool logic steps, and `stream` ONLY for final response?
-                # OR: Standard ReAct loop.
-                
-                # Let's try a simpler approach compatible with streaming:
-                # 1. Invoke with tools. 2. If valid response, yield. 3. If tool call, execute and re-invoke.
+                # Collected per token and joined once, instead of re-copying the string on every chunk
+                answer_chunks = []
                 
                 current_messages = lc_messages.copy()
+                used_tools = False
                 
-                # Step 1: Get Initial Response (possibly tool call)
-                response = llm_with_tools.invoke(current_messages)
-                
-                # Loop to resolve all tool calls first
-                # We use .invoke() here to effectively "think" and decide on tools.
-                # If a tool is called, we execute it, append the result, and loop again.
-                # We discard the text content from these intermediate steps because we want
-                # to stream the FINAL answer freshly after all context is gathered.
-                for _ in range(3):
-                    if response.tool_calls:
-                        # Append the AIMessage *once* with all tool calls
-                        current_messages.append(response)
-                        
-                        for tool_call in response.tool_calls:
-                            print(f"🔧 Tool Call: {tool_call['name']}: {tool_call['args']}")
-                            
-                            tool_result_content = ""
-                            try:
-                                if tool_call["name"] == "WebSearchTool":
-                                    tool_result_content = WebSearchTool.invoke(tool_call["args"])
-                                elif tool_call["name"] == "EmergencyCallTool":
-                                    tool_result_content = EmergencyCallTool.invoke(tool_call["args"])
-                                elif tool_call["name"] == "EmergencySmsTool":
-                                    tool_result_content = EmergencySmsTool.invoke(tool_call["args"])
-                            except Exception as e:
-                                tool_result_content = f"Error executing tool: {str(e)}"
-                                
-                            print(f"✅ Tool Result: {tool_result_content[:50]}...")
-                            
-                            # Append Tool Result
-                            current_messages.append(ToolMessage(content=tool_result_content, tool_call_id=tool_call["id"]))
-                        
-                        # Get next response (continue thinking with new context)
-                        response = llm_with_tools.invoke(current_messages)
-                        
-                    else:
-                        # No more tools, we have the final logic state.
-                        # We break here and proceed to stream the final answer below.
+                # ReAct loop: each step is streamed token by token and its chunks merged into one message.
+                # Once a chunk carries tool calls, the rest of the step's text is held back: it's the
+                # tool plan ("I will search for..."), which must not reach the user (nor mention an
+                # emergency alert). Cohere sends the plan in the same chunk as the tool calls.
+                # If the step asked for tools, run them, append the results and stream the next step.
+                # At most 3 tool rounds; a 4th step that still wants tools gets a fallback reply.
+                for step in range(4):
+                    response = None
+                    calling_tools = False
+                    async for chunk in llm_with_tools.astream(current_messages):
+                        response = chunk if response is None else response + chunk
+                        if chunk.tool_call_chunks:
+                            calling_tools = True
+                        if chunk.content and not calling_tools:
+                            answer_chunks.append(chunk.content)
+                            yield chunk.content
+
+                    if response is None or not response.tool_calls:
                         break
-                
-                # Now that all tools are resolved and context is full, 
-                # we stream the FINAL answer to the user.
-                async for chunk in llm_with_tools.astream(current_messages):
-                    content = chunk.content
-                    if content:
-                        final_answer_accumulated += content
-                        yield content
+                    if step == 3:
+                        fallback = f"\n\n{TOOL_LIMIT_REPLY}" if answer_chunks else TOOL_LIMIT_REPLY
+                        answer_chunks.append(fallback)
+                        yield fallback
+                        break
+
+                    used_tools = True
+                    # Append the AIMessage *once* with all tool calls
+                    current_messages.append(response)
+                    
+                    # Tools don't depend on each other, so run them concurrently
+                    for tool_call in response.tool_calls:
+                        log.info("Tool call: %s: %s", tool_call['name'], tool_call['args'])
+                    results = await asyncio.gather(
+                        *[run_tool(tool_map, tool_call) for tool_call in response.tool_calls],
+                        return_exceptions=True
+                    )
+                    for tool_call, result in zip(response.tool_calls, results):
+                        tool_result_content = f"Error executing tool: {result}" if isinstance(result, Exception) else str(result)
+                        log.debug("Tool result: %s...", tool_result_content[:50])
+                        current_messages.append(ToolMessage(content=tool_result_content, tool_call_id=tool_call["id"]))
                         
-                # Save to DB
-                print("✅ Conversation turn finished. Saving.")
-                await db.message.create(
-                    data={
-                        "text": final_answer_accumulated,
-                        "sender": "bot",
-                        "chatSessionId": chat_id
-                    }
-                )
-                
-                await update_summary(chat_id)
+                # Save to DB without holding the connection open
+                log.info("Conversation turn finished. Saving.")
+                final_answer = "".join(answer_chunks)
+                # Runs after the response has fully closed; the summary must see the saved reply
+                if final_answer:
+                    background_tasks.add_task(save_reply_and_summarize, chat_id, final_answer)
+                # Tool calls (web results, emergency alerts) make a reply unsafe to reuse
+                if cacheable and not used_tools and final_answer:
+                    spawn(cache_reply(body.mode, body.message, final_answer))
 
             except Exception as e:
-                print(f"🔥 Error during stream: {e}")
-                traceback.print_exc()
+                log.exception("Error during stream: %s", e)
 
         return StreamingResponse(response_generator(), media_type="text/plain")
 
     except Exception as e:
-        print(f"🔥 Error in send_message: {e}")
-        traceback.print_exc()
+        log.exception("Error in send_message: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/{chat_id}/upload")
-async def upload_pdf(chat_id: str, file: UploadFile = File(...)):
+async def upload_pdf(chat_id: str, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     try:
         session = await db.chatsession.find_unique(where={"id": chat_id})
         if not session:
@@ -341,52 +657,28 @@ async def upload_pdf(chat_id: str, file: UploadFile = File(...)):
         if not file.filename.endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
+        tmp_path = None
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                shutil.copyfileobj(file.file, tmp)
+            # Stream the upload to disk in 1 MB chunks without blocking the event loop on writes
+            async with aiofiles.tempfile.NamedTemporaryFile("wb", delete=False, suffix=".pdf") as tmp:
                 tmp_path = tmp.name
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    await tmp.write(chunk)
+        except Exception:
+            # delete=False means a failed upload would otherwise leave its partial file behind
+            if tmp_path is not None:
+                await run_in_threadpool(os.remove, tmp_path)
+            raise
         finally:
-            file.file.close()
-
-        try:
-            loader = PyPDFLoader(tmp_path)
-            documents = loader.load()
-            
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-            chunks = text_splitter.split_documents(documents)
-            
-            # Add metadata (chat_id) to link docs to this session
-            for chunk in chunks:
-                chunk.metadata["chat_id"] = chat_id
-                
-            # Store in Chroma
-            if vector_store:
-                # Add unique IDs for chunks to avoid duplicates if re-uploaded (optional logic)
-                vector_store.add_documents(chunks)
-                print(f"✅ Indexed {len(chunks)} chunks for chat {chat_id}")
-            else:
-                print("⚠️ Vector store not initialized, skipping indexing")
-
-        except Exception as e:
-             print(f"🔥 Error processing PDF: {e}")
-             raise HTTPException(status_code=500, detail=f"Error parsing PDF: {str(e)}")
-        finally:
-            # Clean up temp file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+            await file.close()
 
-        await db.message.create(
-            data={
-                "text": f"PDF '{file.filename}' uploaded and analyzed. I am ready to answer questions about it.",
-                "sender": "bot",
-                "chatSessionId": chat_id,
-            }
-        )
+        # index_pdf posts the "ready" (or failure) message itself once indexing finishes
+        background_tasks.add_task(index_pdf, tmp_path, chat_id, file.filename)
 
-        return {"success": True, "message": "File uploaded and indexed successfully"}
+        return {"success": True, "status": "indexing", "message": "File uploaded, indexing in background"}
 
     except HTTPException:
         raise
     except Exception as e:
-        print("🔥 ERROR /chat/{chat_id}/upload:", e)
+        log.error("Error in /chat/%s/upload: %s", chat_id, e)
         raise HTTPException(status_code=500, detail=str(e))
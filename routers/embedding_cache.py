@@ -0,0 +1,134 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+from starlette.concurrency import run_in_threadpool
+
+
+def _text_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{text}".encode(), digest_size=16).digest()
+
+
+class CachedCohereEmbeddings(Embeddings):
+    """
+    Wraps CohereEmbeddings with a content-hash cache so identical texts are
+    only sent to Cohere once.
+
+    Queries are kept in an in-memory LRU. Document vectors are persisted in
+    SQLite so re-uploaded PDFs survive restarts without re-embedding.
+    Query and document vectors are cached separately because Cohere v3
+    embeds them with different input types. Short-lived texts (scraped web
+    snippets) go through aembed_transient_documents so they never hit disk.
+    """
+
+    def __init__(self, embeddings, cache_path: str, max_queries: int = 4096):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", "")
+        self.max_queries = max_queries
+        self._queries: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_path = cache_path
+        self._db = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Opens the SQLite file on first use, so importing the module doesn't create it. Call with _lock held."""
+        if self._db is None:
+            # Several uvicorn workers share the file: WAL lets readers run alongside a writer,
+            # and the timeout makes a concurrent commit wait instead of raising "database is locked"
+            db = sqlite3.connect(self.cache_path, check_same_thread=False, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS emb (h BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    # --- Query cache (in-memory LRU) ---
+    def _get_query(self, key: bytes):
+        with self._lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+            return vector
+
+    def _put_query(self, key: bytes, vector: List[float]):
+        with self._lock:
+            self._queries[key] = vector
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = _text_key(self.model, text)
+        vector = self._get_query(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._put_query(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = _text_key(self.model, text)
+        vector = self._get_query(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._put_query(key, vector)
+        return vector
+
+    # --- Document cache (SQLite) ---
+    def _load_documents(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            db = self._connection()
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = db.execute(f"SELECT h, vec FROM emb WHERE h IN ({placeholders})", batch)
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def _store_documents(self, vectors: Dict[bytes, List[float]]):
+        with self._lock:
+            db = self._connection()
+            db.executemany(
+                "INSERT OR REPLACE INTO emb (h, vec) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in vectors.items()],
+            )
+            db.commit()
+
+    def _split_cached(self, texts: List[str]):
+        keys = [_text_key(self.model, text) for text in texts]
+        found = self._load_documents(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+        return keys, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split_cached(texts)
+        if missing:
+            fresh = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self._store_documents(fresh)
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # SQLite reads/commits block, so keep them off the event loop
+        keys, found, missing = await run_in_threadpool(self._split_cached, texts)
+        if missing:
+            fresh = dict(zip(missing, await self.embeddings.aembed_documents(list(missing.values()))))
+            await run_in_threadpool(self._store_documents, fresh)
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    async def aembed_transient_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds documents without the SQLite cache, for texts unlikely to be seen again."""
+        return await self.embeddings.aembed_documents(texts)
@@ -1,11 +1,33 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import os
+from concurrent.futures import ThreadPoolExecutor
 from twilio.rest import Client
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 load_dotenv()
 
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER")
+TWILIO_TO_NUMBER = os.getenv("TWILIO_TO_NUMBER")
+
+def _build_twilio_client():
+    """One Twilio client per process, so alerts skip client setup and TLS handshakes."""
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER, TWILIO_TO_NUMBER]):
+        return None
+    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    # Let the SMS and the call share keep-alive connections
+    session = getattr(client.http_client, "session", None)
+    if session is not None:
+        session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
+    return client
+
+twilio_client = _build_twilio_client()
+# Bounded pool for alert dispatch, so a burst of triggers can't spawn unbounded threads
+alert_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="twilio-alert")
+
 router = APIRouter(prefix="/emergency", tags=["Emergency"])
 
 class EmergencyRequest(BaseModel):
@@ -13,56 +35,42 @@ class EmergencyRequest(BaseModel):
     location: str | None = None
     severity: str = "critical" # 'medium' (SMS only) or 'critical' (Call+SMS)
 
-import threading
-
-def _send_twilio_alert(type: str, severity: str, location: str | None, account_sid, auth_token, from_number, to_number):
+def _send_twilio_alert(type: str, severity: str, location: str | None):
     try:
-        client = Client(account_sid, auth_token)
-        
         # 1. Send SMS (Always for SOS)
         sms_body = f"🚨 {severity.upper()} SOS ALERT! 🚨\nUser has triggered an emergency alert via MedGamma."
         if location:
             sms_body += f"\nLast Known Location: {location}"
             
-        message = client.messages.create(
+        message = twilio_client.messages.create(
             body=sms_body,
-            from_=from_number,
-            to=to_number
+            from_=TWILIO_FROM_NUMBER,
+            to=TWILIO_TO_NUMBER
         )
         print(f"✅ SMS Sent: {message.sid}")
 
         # 2. Make Call (Only for Critical)
         if severity == "critical":
-            call = client.calls.create(
+            call = twilio_client.calls.create(
                  twiml='<Response><Say voice="alice">Hello Srijan, Emergency Alert. The user has triggered an SOS button in the Med Gamma application. Please check your messages immediately.</Say></Response>',
-                 to=to_number,
-                 from_=from_number
+                 to=TWILIO_TO_NUMBER,
+                 from_=TWILIO_FROM_NUMBER
             )
             print(f"✅ Call Initiated: {call.sid}")
     except Exception as e:
         print(f"🔥 Twilio Error: {e}")
 
-@router.post("/trigger")
 def execute_emergency_trigger(type: str, severity: str, location: str | None = None):
-    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-    from_number = os.getenv("TWILIO_FROM_NUMBER")
-    to_number = os.getenv("TWILIO_TO_NUMBER")
-
-    if not all([account_sid, auth_token, from_number, to_number]):
+    if twilio_client is None:
         print("❌ Twilio credentials missing.")
         return "[SYSTEM]: Emergency credentials missing. Advise user to call emergency services manually."
 
-    # Run in background thread so chat is not blocked
-    thread = threading.Thread(
-        target=_send_twilio_alert,
-        args=(type, severity, location, account_sid, auth_token, from_number, to_number)
-    )
-    thread.daemon = True
-    thread.start()
+    # Run in the alert pool so chat is not blocked
+    alert_pool.submit(_send_twilio_alert, type, severity, location)
     
     # Return instruction for the LLM, NOT a message for the User
     return "[SYSTEM]: Emergency alert triggered in background. Focus on providing emotional support. Do NOT mention the alert trigger to the user."
+
 @router.post("/trigger")
 async def trigger_emergency(request: EmergencyRequest):
     result = execute_emergency_trigger(request.type, request.severity, request.location)
@@ -0,0 +1,59 @@
+import hashlib
+import re
+import time
+from typing import Optional
+
+# Anything that might need the emergency tools must reach the model. Embedding distance
+# can't tell "I want to kill myself" from "I don't want to kill myself", so screen by keyword.
+CRISIS_RE = re.compile(
+    r"suicid|kill (my|him|her|them)sel|end (my|it all)|take my (own )?life|want to die|wanna die|"
+    r"hurt (my|him|her)sel|self[- ]?harm|cut(ting)? myself|overdos|bleeding|can'?t breathe|emergency|\bsos\b",
+    re.IGNORECASE,
+)
+
+def is_crisis_message(message: str) -> bool:
+    return CRISIS_RE.search(message) is not None
+
+
+class SemanticResponseCache:
+    """
+    Caches bot replies in a dedicated Chroma collection, keyed by the embedding
+    of (mode, message), so near-duplicate prompts can skip the LLM entirely.
+
+    Only safe for stateless turns: callers must not use it when chat history,
+    a summary, document excerpts or tool calls can change the answer.
+    Messages that look like a crisis are never served from or stored in the cache.
+    Blocking (embedding + Chroma HTTP), so call it from a threadpool.
+    """
+
+    def __init__(self, store, max_distance: float = 0.15, ttl_seconds: int = 3600):
+        self.store = store
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _key_text(mode: str, message: str) -> str:
+        return f"{mode}: {' '.join(message.lower().split())}"
+
+    def lookup(self, mode: str, message: str) -> Optional[str]:
+        if is_crisis_message(message):
+            return None
+        hits = self.store.similarity_search_with_score(self._key_text(mode, message), k=1, filter={"mode": mode})
+        if not hits:
+            return None
+        doc, distance = hits[0]
+        if distance > self.max_distance or doc.metadata.get("expires_at", 0) < time.time():
+            return None
+        return doc.metadata.get("response")
+
+    def store_response(self, mode: str, message: str, response: str):
+        if is_crisis_message(message):
+            return
+        key_text = self._key_text(mode, message)
+        # Same prompt -> same ID, so a refresh overwrites the expired entry
+        entry_id = hashlib.blake2b(key_text.encode(), digest_size=16).hexdigest()
+        self.store.add_texts(
+            [key_text],
+            metadatas=[{"mode": mode, "response": response, "expires_at": time.time() + self.ttl_seconds}],
+            ids=[entry_id],
+        )
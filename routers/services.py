@@ -11,6 +11,7 @@ except ImportError:
 
 from langchain_cohere import ChatCohere, CohereEmbeddings
 from dotenv import load_dotenv
+from .embedding_cache import CachedCohereEmbeddings
 
 load_dotenv()
 
@@ -23,7 +24,11 @@ llm = ChatCohere(
     temperature=0.3
 )
 
-embeddings = CohereEmbeddings(
-    model="embed-english-v3.0",
-    cohere_api_key=cohere_api_key
+# Cache embeddings by content hash so repeated chunks/queries skip the Cohere round-trip
+embeddings = CachedCohereEmbeddings(
+    CohereEmbeddings(
+        model="embed-english-v3.0",
+        cohere_api_key=cohere_api_key
+    ),
+    cache_path=os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite"),
 )
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+class LocalVectorIndex:
+    """
+    In-process FAISS IndexFlatIP per chat, mirroring the chunks stored in Chroma.
+    Chroma stays the durable store; a chat's index is loaded from it on first
+    use and dropped (least recently used first) once max_chats are resident.
+    Each worker process has its own mirror and can't see uploads handled by
+    another, so a loaded chat is only trusted for ttl_seconds before it must be
+    reloaded.
+    Cohere v3 embeddings are unit length, so inner product == cosine similarity.
+    """
+
+    def __init__(self, max_chats: int = 256, ttl_seconds: float = 60):
+        self.max_chats = max_chats
+        self.ttl_seconds = ttl_seconds
+        self._chats: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return faiss is not None
+
+    def is_loaded(self, chat_id: str) -> bool:
+        """True if the chat is resident and was loaded less than ttl_seconds ago."""
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            return entry is not None and time.monotonic() - entry[2] < self.ttl_seconds
+
+    def size(self, chat_id: str) -> int:
+        """Number of vectors held for the chat (0 if not loaded)."""
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None or entry[0] is None:
+                return 0
+            return entry[0].ntotal
+
+    def load(self, chat_id: str, vectors, documents: List[Document]):
+        """Replaces the chat's index with the given vectors/documents."""
+        self._put(chat_id, (None, [], time.monotonic()))
+        self.add(chat_id, vectors, documents)
+
+    def add(self, chat_id: str, vectors, documents: List[Document]):
+        """Appends to the chat's index. No-op if the chat isn't loaded yet."""
+        if len(documents) == 0:
+            return
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if chat_id not in self._chats:
+                return
+            index, docs, loaded_at = self._chats[chat_id]
+            if index is None:
+                index = faiss.IndexFlatIP(matrix.shape[1])
+            index.add(matrix)
+            self._chats[chat_id] = (index, docs + list(documents), loaded_at)
+
+    def invalidate(self, chat_id: str):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+    def search(
+        self,
+        chat_id: str,
+        query_vector,
+        k: int,
+        fetch_k: int = None,
+        min_score: float = None,
+        lambda_mult: float = 0.5,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Returns up to k (document, cosine similarity) pairs.
+        With fetch_k, the top fetch_k hits are re-ranked by maximal marginal
+        relevance so near-duplicate chunks don't crowd out the rest.
+        Hits scoring below min_score are dropped.
+        """
+        query = np.asarray([query_vector], dtype=np.float32)
+        # FAISS indexes aren't safe to search while another thread adds to them
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None:
+                return []
+            self._chats.move_to_end(chat_id)
+            index, docs, _ = entry
+            if index is None or index.ntotal == 0:
+                return []
+            scores, ids = index.search(query, min(max(k, fetch_k or 0), index.ntotal))
+            hits = [(int(i), float(score)) for score, i in zip(scores[0], ids[0]) if i != -1]
+            if min_score is not None:
+                hits = [(i, score) for i, score in hits if score >= min_score]
+            if fetch_k and len(hits) > k:
+                candidates = np.vstack([index.reconstruct(i) for i, _ in hits])
+                hits = [hits[j] for j in _mmr(query[0], candidates, k, lambda_mult)]
+        return [(docs[i], score) for i, score in hits[:k]]
+
+    def _put(self, chat_id: str, entry: tuple):
+        with self._lock:
+            self._chats[chat_id] = entry
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+
+def _mmr(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """Greedy maximal marginal relevance over unit vectors; returns row indices in pick order."""
+    query_sims = candidates @ query
+    pairwise_sims = candidates @ candidates.T
+    selected = [int(np.argmax(query_sims))]
+    while len(selected) < min(k, len(candidates)):
+        redundancy = pairwise_sims[:, selected].max(axis=1)
+        scores = lambda_mult * query_sims - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
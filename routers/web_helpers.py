@@ -1,145 +1,519 @@
-from .services import llm
+import os
+import re
+import hashlib
+from .services import embeddings
+from .cache import QueryCache, RedisCache, DiskCache
 try:
     from duckduckgo_search import DDGS
+    from duckduckgo_search.exceptions import RatelimitException
 except ImportError:
     from ddgs import DDGS
-import requests
-from bs4 import BeautifulSoup
-import traceback
+    from ddgs.exceptions import RatelimitException
+import asyncio
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Optional
+from urllib.parse import urlsplit
+import httpx
+from starlette.concurrency import run_in_threadpool
+from selectolax.lexbor import LexborHTMLParser as HTMLParser
+try:
+    import trafilatura
+except ImportError:
+    trafilatura = None
+import logging
+import functools
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+log = logging.getLogger(__name__)
+
+# Scraped pages are cut into snippets and only the most query-relevant ones are returned
+snippet_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+TOP_SNIPPETS = 3
+# Pages advertising more than this are skipped outright
+MAX_PAGE_BYTES = 2_000_000
+# Read budget per page: enough for articles behind heavy heads and inline scripts,
+# small enough that the threadpool parse stays quick. Reading also stops at the
+# end of the main content, since everything after it is discarded anyway.
+PAGE_READ_BYTES = 512_000
+CONTENT_END_RE = re.compile(rb"</(?:article|main)\s*>", re.IGNORECASE)
+
+# Page-cleanup constants, built once instead of on every scrape
+STRIP_TAGS = ["script", "style", "nav", "header", "footer", "aside", "form"]
+CONTENT_SELECTOR = "article, main, div.content, div.main, div.post-content, div.article-body, div.story-body"
+NEWLINE_RUN_RE = re.compile(r"\n{3,}")
+# Puzzles/games that often appear in "news"
+PUZZLE_RE = re.compile(r"crossword|puzzle|wordle|sudoku|connections", re.IGNORECASE)
+# Paywalled / JS-only sites that never yield article text; SCRAPE_BLOCKED_DOMAINS (comma-separated) overrides
+BLOCKED_DOMAINS = frozenset(
+    d.strip().lower()
+    for d in os.getenv("SCRAPE_BLOCKED_DOMAINS", "nytimes.com,wsj.com,ft.com,bloomberg.com").split(",")
+    if d.strip()
+)
+
+def is_blocked_url(url: str) -> bool:
+    host = (urlsplit(url).hostname or "").removeprefix("www.")
+    return any(host == d or host.endswith("." + d) for d in BLOCKED_DOMAINS)
+
+# Two-tier cache for searches and scraped pages: an in-process LRU (WEBCACHE_TTL seconds)
+# in front of a shared Redis cache (REDIS_URL) or, failing that, an on-disk one (WEB_CACHE_DIR).
+# The second tier is a no-op when neither is set.
+WEBCACHE_TTL = int(os.getenv("WEBCACHE_TTL", "3600"))
+local_web_cache = QueryCache(max_size=512, ttl_seconds=WEBCACHE_TTL)
+web_cache = RedisCache(os.getenv("REDIS_URL")) if os.getenv("REDIS_URL") else DiskCache(os.getenv("WEB_CACHE_DIR"))
+SEARCH_CACHE_TTL = 15 * 60
+PAGE_CACHE_TTL = 24 * 60 * 60
+
+def cache_key(kind: str, text: str) -> str:
+    return f"{kind}:{hashlib.blake2b(text.encode(), digest_size=16).hexdigest()}"
+
+async def cache_get(key: str):
+    value = local_web_cache.get((key,))
+    if value is None:
+        value = await web_cache.get(key)
+        if value is not None:
+            local_web_cache.put((key,), value)
+    return value
+
+async def cache_set(key: str, value, ttl_seconds: int):
+    local_web_cache.put((key,), value)
+    await web_cache.set(key, value, ttl_seconds)
+
+MAX_CONCURRENT_FETCHES = 16
+MAX_FETCHES_PER_HOST = 2
 
-def fetch_content(url: str, max_chars: int = 8000) -> str:
+def build_http_client() -> httpx.AsyncClient:
     """
-    Fetches the URL and extracts text using heuristics to find the main content.
+    Pooled client for all scrapes, so connections (and HTTP/2 sessions) are reused across searches.
+    Separate connect/read timeouts, and failed connects are retried before giving up on a URL.
+    Idle connections are kept for 30s, so repeat hits on a news site skip DNS + TLS setup.
     """
-    try:
-        print(f"🕸️ Scraping: {url}")
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url, headers=headers, timeout=5)
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=2,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=30),
+        ),
+        timeout=httpx.Timeout(5, connect=3, pool=3),
+        follow_redirects=True,
+        headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'},
+    )
+
+# The client's connection pool and the semaphores belong to the event loop that first uses them,
+# so they're created lazily and rebuilt if a different loop shows up (scripts run each search on a fresh loop).
+# At most MAX_CONCURRENT_FETCHES downloads in flight, and MAX_FETCHES_PER_HOST per host so news sites don't return 429s.
+scrape_loop = None
+http_client = None
+fetch_semaphore = None
+host_semaphores = weakref.WeakValueDictionary()
+
+def scrape_client() -> httpx.AsyncClient:
+    global scrape_loop, http_client, fetch_semaphore
+    loop = asyncio.get_running_loop()
+    if http_client is None or scrape_loop is not loop:
+        scrape_loop = loop
+        http_client = build_http_client()
+        fetch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+        host_semaphores.clear()
+    return http_client
+
+def host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).hostname or ""
+    semaphore = host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = host_semaphores[host] = asyncio.Semaphore(MAX_FETCHES_PER_HOST)
+    return semaphore
+
+async def close_web_clients():
+    """Closes the scraping client and cache connections; called on app shutdown."""
+    global scrape_loop, http_client, fetch_semaphore
+    client = http_client
+    scrape_loop = http_client = fetch_semaphore = None
+    host_semaphores.clear()
+    if client is not None:
+        await client.aclose()
+    await web_cache.aclose()
+
+def looks_like_html(head: bytes) -> bool:
+    start = head.lstrip()[:1024].lower()
+    return start.startswith(b"<") or b"<html" in start
+
+async def download_page(url: str) -> str:
+    """
+    Streams the page's HTML, stopping at the end of its <article>/<main> or after PAGE_READ_BYTES.
+    Returns "" for non-HTML or oversized pages, judged from the response headers
+    (or the first chunk when there's no Content-Type) before the body is read.
+    """
+    # Stream the body and stop early, rather than downloading (and parsing) markup we'd throw away
+    async with scrape_client().stream("GET", url) as response:
         response.raise_for_status()
+
+        content_type = response.headers.get('Content-Type', '')
+        if content_type and 'html' not in content_type:
+            log.debug("Skipping non-HTML page (%s): %s", content_type, url)
+            return ""
+        # Don't bother parsing pathological pages
+        if int(response.headers.get('Content-Length') or 0) > MAX_PAGE_BYTES:
+            log.debug("Skipping oversized page: %s", url)
+            return ""
+
+        body = bytearray()
+        async for chunk in response.aiter_bytes(16384):
+            # No Content-Type to go on: sniff the first chunk for markup
+            if not body and not content_type and not looks_like_html(chunk):
+                log.debug("Skipping non-HTML page (sniffed): %s", url)
+                return ""
+            # Search the new chunk plus a little overlap, in case the closing tag straddles two chunks
+            tail_start = max(0, len(body) - 16)
+            body.extend(chunk)
+            if len(body) >= PAGE_READ_BYTES or CONTENT_END_RE.search(body, tail_start):
+                break
+        return body.decode(response.encoding or 'utf-8', errors='replace')
+
+def extract_text(html: str, max_chars: int) -> str:
+    """
+    Extracts the page's main text. Uses trafilatura's main-content extractor when
+    installed, falling back to our own selectolax heuristics when it's missing or
+    finds nothing. CPU-bound, so call it off the event loop.
+    """
+    if trafilatura is not None:
+        try:
+            text_content = trafilatura.extract(html, include_comments=False, include_tables=False, favor_recall=True)
+        except Exception as e:
+            log.debug("trafilatura failed, using heuristics: %s", e)
+            text_content = None
+        if text_content:
+            return NEWLINE_RUN_RE.sub('\n\n', text_content)[:max_chars]
+
+    return extract_text_heuristic(html, max_chars)
+
+def extract_text_heuristic(html: str, max_chars: int) -> str:
+    """
+    Extracts the page's main text using heuristics to find the content area.
+    Parsed with selectolax's C (lexbor) parser rather than a pure-Python one.
+    """
+    tree = HTMLParser(html)
+    
+    # 1. Remove unwanted elements (one pass in C instead of a Python loop per node)
+    tree.strip_tags(STRIP_TAGS)
         
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 1. Remove unwanted elements
-        for script in soup(["script", "style", "nav", "header", "footer", "aside", "form"]):
-            script.decompose()
-            
-        # 2. Try to find the main content area
-        content_node = soup.find('article')
-        if not content_node:
-            content_node = soup.find('main')
-            
-        # 3. Fallback: Look for divs with specific classes/ids
-        if not content_node:
-             possible_content_roots = soup.find_all('div', {"class": ["content", "main", "post-content", "article-body", "story-body"]})
-             if possible_content_roots:
-                 # Pick the one with the most text
-                 content_node = max(possible_content_roots, key=lambda x: len(x.get_text()))
-        
+    # 2. Collect every candidate content area with one combined selector, evaluated in C
+    article = main = None
+    content_divs = []
+    for node in tree.css(CONTENT_SELECTOR):
+        if node.tag == 'article':
+            article = article if article is not None else node
+        elif node.tag == 'main':
+            main = main if main is not None else node
+        else:
+            content_divs.append(node)
+
+    # 3. Prefer <article>, then <main>, then the content div with the most text.
+    # Each div's text is extracted once and the winner's is reused as-is.
+    content_node = article if article is not None else main
+    if content_node is None and content_divs:
+        text_content = max((div.text(separator='\n', strip=True) for div in content_divs), key=len)
+    else:
         # 4. Fallback to body if nothing specific found
-        if not content_node:
-            content_node = soup.body
+        if content_node is None:
+            content_node = tree.body
+        if content_node is None:
+            return ""
+        # 5. Extract text with separator
+        text_content = content_node.text(separator='\n', strip=True)
+    
+    # 6. Basic cleanup (collapsing multiple newlines)
+    text_content = NEWLINE_RUN_RE.sub('\n\n', text_content)
+    return text_content[:max_chars]
 
-        if not content_node:
+async def fetch_content(url: str, max_chars: int = 8000) -> str:
+    """
+    Fetches the URL and returns its main text, at most max_chars.
+    The download stays on the event loop; parsing runs in the shared threadpool
+    so concurrent scrapes don't queue up behind each other's parses.
+    """
+    key = cache_key("page", url)
+    cached = await cache_get(key)
+    if cached is not None:
+        log.debug("Cached page: %s", url)
+        return cached[:max_chars]
+
+    try:
+        log.debug("Scraping: %s", url)
+        scrape_client()  # make sure the semaphores belong to this loop
+        async with fetch_semaphore, host_semaphore(url):
+            html = await download_page(url)
+        if not html:
             return ""
 
-        # 5. Extract text with separator
-        text_content = content_node.get_text(separator='\n', strip=True)
-        
-        # 6. Basic cleanup (collapsing multiple newlines)
-        import re
-        text_content = re.sub(r'\n{3,}', '\n\n', text_content)
-        # print("text_content", text_content)
-        return text_content[:max_chars]
+        text_content = await run_in_threadpool(extract_text, html, max_chars)
+        if text_content:
+            await cache_set(key, text_content, PAGE_CACHE_TTL)
+        return text_content
     except Exception as e:
-        print(f"⚠️ Scraping Failed for {url}: {e}")
+        log.warning("Scraping Failed for %s: %s", url, e)
         return ""
 
-def run_web_search(query: str) -> str:
+async def select_relevant_snippets(query: str, text: str, k: int = TOP_SNIPPETS) -> str:
+    """
+    Splits scraped text into ~500-char snippets and keeps the k most similar to the query,
+    in their original order.
+    """
+    snippets = snippet_splitter.split_text(text)
+    if len(snippets) <= k:
+        return text
+
+    # Cohere embeddings are unit length, so a dot product is the cosine similarity
+    snippet_vectors, query_vector = await asyncio.gather(
+        # Web snippets are one-off, so don't grow the persistent embedding cache with them
+        embeddings.aembed_transient_documents(snippets),
+        embeddings.aembed_query(query),
+    )
+    snippet_vectors = np.asarray(snippet_vectors, dtype=np.float32)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    top = sorted(np.argsort(snippet_vectors @ query_vector)[-k:])
+    return "\n...\n".join(snippets[i] for i in top)
+
+# Optional outbound proxies for DDG (comma-separated http:// or socks5:// URLs), used round-robin.
+# A proxy that gets rate limited sits out DDG_PROXY_COOLDOWN seconds.
+ddg_proxies = deque(p.strip() for p in os.getenv("DDG_PROXIES", "").split(",") if p.strip())
+ddg_proxy_cooldowns = {}
+ddg_proxy_lock = threading.Lock()
+DDG_PROXY_COOLDOWN = 60
+# How long news gets before a text search is started alongside it
+DDG_HEDGE_DELAY = 1.5
+
+def next_ddg_proxy() -> Optional[str]:
+    """Next proxy that isn't cooling down, or None to connect directly."""
+    with ddg_proxy_lock:
+        now = time.monotonic()
+        for _ in range(len(ddg_proxies)):
+            proxy = ddg_proxies[0]
+            ddg_proxies.rotate(-1)
+            if ddg_proxy_cooldowns.get(proxy, 0) <= now:
+                return proxy
+        return None
+
+def cool_down_ddg_proxy(proxy: str):
+    with ddg_proxy_lock:
+        ddg_proxy_cooldowns[proxy] = time.monotonic() + DDG_PROXY_COOLDOWN
+
+# DDGS is synchronous and keeps its own HTTP session; reuse one per (worker thread, proxy)
+# instead of building a new one per call (sharing one across threads isn't safe)
+ddgs_local = threading.local()
+
+def ddgs_client(proxy: Optional[str]) -> DDGS:
+    clients = getattr(ddgs_local, "clients", None)
+    if clients is None:
+        clients = ddgs_local.clients = {}
+    if proxy not in clients:
+        clients[proxy] = DDGS(proxy=proxy)
+    return clients[proxy]
+
+def ddg_search(kind: str, query: str) -> list:
+    """Runs DDGS().news or .text, moving on to the next proxy when one is rate limited."""
+    attempts = max(1, len(ddg_proxies))
+    for attempt in range(attempts):
+        proxy = next_ddg_proxy()
+        try:
+            return list(getattr(ddgs_client(proxy), kind)(query, max_results=5))
+        except RatelimitException:
+            if proxy is None:
+                raise
+            log.warning("DDG rate limited via proxy, cooling it down for %ds", DDG_PROXY_COOLDOWN)
+            cool_down_ddg_proxy(proxy)
+            if attempt == attempts - 1:
+                raise
+    return []
+
+async def search_ddg(query: str) -> list:
+    """
+    DDG news results for the query, falling back to text search. Cached for 15 minutes.
+    The text search is only started early (hedged) when news is slow, so most
+    searches cost DDG a single request.
+    """
+    key = cache_key("ddg", query.strip().lower())
+    results = await cache_get(key)
+    if results is not None:
+        log.debug("Cached DDG results for: %s", query)
+        return results
+
+    log.info("Searching DDG News for: %s", query)
+    # Prefer .news() to get specific articles rather than homepages
+    # (DDGS is synchronous, so keep it off the event loop)
+    news_task = asyncio.create_task(run_in_threadpool(ddg_search, "news", query))
+    text_task = None
+    done, _ = await asyncio.wait({news_task}, timeout=DDG_HEDGE_DELAY)
+    if not done:
+        log.debug("DDG news slow, starting text search alongside")
+        text_task = asyncio.create_task(run_in_threadpool(ddg_search, "text", query))
+
     try:
-        print(f"🔎 Searching DDG News for: {query}")
-        # Use .news() to get specific articles rather than homepages
-        results = list(DDGS().news(query, max_results=5)) 
-        
-        if not results:
-             # Fallback to text search if news fails
-             print("⚠️ No news results, falling back to text search...")
-             results = list(DDGS().text(query, max_results=5))
+        results = await news_task
+    except Exception as e:
+        log.warning("DDG news search failed: %s", e)
+        results = []
+
+    if results:
+        if text_task is not None:
+            # The worker thread still finishes; just drop (and retrieve) its result
+            text_task.cancel()
+            text_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    else:
+        # Fallback to text search if news fails
+        log.info("No news results, falling back to text search...")
+        try:
+            results = await (text_task if text_task is not None else run_in_threadpool(ddg_search, "text", query))
+        except Exception as e:
+            log.warning("DDG text search failed: %s", e)
+            results = []
+
+    if results:
+        await cache_set(key, results, SEARCH_CACHE_TTL)
+    return results
+
+async def run_web_search_async(query: str) -> str:
+    """
+    DDG search plus a concurrent deep dive into the top results.
+    Returns markdown highlights and the most relevant snippets of one article.
+    """
+    key = cache_key("search", query.strip().lower())
+    cached = await cache_get(key)
+    if cached is not None:
+        log.info("Cached web search for: %s", query)
+        return cached
+
+    try:
+        results = await search_ddg(query)
              
         if not results:
             return ""
             
-        formatted_output = "**Search Highlights:**\n"
+        # Built as a list and joined once at the end
+        parts = ["**Search Highlights:**\n"]
         
         # 1. Add snippets for top 3
         for r in results[:3]:
             title = r.get('title', 'No Title')
             link = r.get('href', r.get('url', '#'))
             body = r.get('body', '')
-            formatted_output += f"- [{title}]({link}): {body}\n"
+            parts.append(f"- [{title}]({link}): {body}\n")
         
-        # 2. Deep Dive: Try to find ONE good article (iterating through top 3)
-        best_content = ""
-        used_source = ""
-        
-        for i, result in enumerate(results[:3]):
+        # 2. Deep Dive: fetch the top 3 concurrently and take the first good article to arrive
+        candidates = {}
+        for result in results[:3]:
             url = result.get('href', result.get('url'))
             title = result.get('title', 'Source')
             
-            if not url:
+            if not url or url in candidates:
                 continue
                 
             # Skip puzzles/games that often appear in "news"
-            if any(x in title.lower() for x in ['crossword', 'puzzle', 'wordle', 'sudoku', 'connections']):
-                print(f"⏩ Skipping puzzle result: {title}")
+            if PUZZLE_RE.search(title):
+                log.debug("Skipping puzzle result: %s", title)
                 continue
 
-            print(f"🚀 Attempt {i+1}: Fetching deep content from: {url}")
-            content = fetch_content(url)
-            
-            # heuristic: if content is > 500 chars, it's probably a full article
-            if len(content) > 500:
-                best_content = content
-                used_source = title
-                print(f"✅ Found good content ({len(content)} chars) from {title}")
-                break
-            elif len(content) > len(best_content):
-                # keep the longest one we found so far even if it's short
-                best_content = content
-                used_source = title
+            if is_blocked_url(url):
+                log.debug("Skipping blocked domain: %s", url)
+                continue
+
+            candidates[url] = title
+
+        async def fetch_candidate(url: str, title: str):
+            return title, await fetch_content(url)
+
+        log.info("Fetching deep content from %d sources", len(candidates))
+        tasks = [asyncio.create_task(fetch_candidate(url, title)) for url, title in candidates.items()]
+
+        best_content = ""
+        used_source = ""
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    title, content = await next_done
+                except Exception:
+                    continue
+
+                # heuristic: if content is > 500 chars, it's probably a full article
+                if len(content) > 500:
+                    best_content = content
+                    used_source = title
+                    log.info("Found good content (%d chars) from %s", len(content), title)
+                    break
+                elif len(content) > len(best_content):
+                    # keep the longest one we found so far even if it's short
+                    best_content = content
+                    used_source = title
+        finally:
+            # The slower fetches are no longer needed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
         
         if best_content:
-             formatted_output += f"\n\n**Detailed Concept from {used_source}:**\n{best_content}\n"
+             try:
+                 best_content = await select_relevant_snippets(query, best_content)
+             except Exception as e:
+                 log.warning("Snippet ranking failed, using full content: %s", e)
+             parts.append(f"\n\n**Detailed Concept from {used_source}:**\n{best_content}\n")
         else:
-            formatted_output += "\n\n(Could not scrape full article content from top results. Rely on snippets above.)"
+            parts.append("\n\n(Could not scrape full article content from top results. Rely on snippets above.)")
 
+        formatted_output = "".join(parts)
+        await cache_set(key, formatted_output, SEARCH_CACHE_TTL)
         return formatted_output
     except Exception as e:
-        print(f"🔥 Web Search Error: {e}")
-        traceback.print_exc()
+        log.exception("Web Search Error: %s", e)
         return ""
 
-# async def route_query(query: str, chat_history_str: str) -> str:
-#     """
-#     Decides if the query needs web access. 
-#     Returns 'WEB' or 'CHAT'.
-#     """
-#     router_prompt = f"""
-#     You are a routing assistant. Decide if the latest user query requires external knowledge from the Internet (e.g. current events, specific facts not in conversation, up-to-date info) or if it can be answered from the chat history.
-    
-#     Conversation History Summary:
-#     {chat_history_str}
-    
-#     Latest Query: {query}
-    
-#     Answer ONLY with 'WEB' if internet search is needed, or 'CHAT' if not needed.
-#     """
-#     try:
-#         # Use a lower temp for deterministic routing
-#         response = llm.invoke(router_prompt)
-#         decision = response.content.strip().upper()
-#         if "WEB" in decision:
-#             return "WEB"
-#         return "CHAT"
-#     except Exception as e:
-#         print(f"⚠️ Router Error: {e}")
-#         return "CHAT"
+def run_web_search(query: str) -> str:
+    """Blocking wrapper around run_web_search_async for scripts; don't call it from a running event loop."""
+    async def search_once() -> str:
+        # Each call gets a fresh loop, so release this loop's connections before it closes
+        try:
+            return await run_web_search_async(query)
+        finally:
+            await close_web_clients()
+
+    # Standalone scripts get uvloop here; the server picks it with `--loop uvloop`
+    run = uvloop.run if uvloop is not None and hasattr(uvloop, "run") else asyncio.run
+    return run(search_once())
+
+# Cheap keyword routing so obvious small talk skips the web tool entirely
+# Whole words only, so "newsletter" or "currently" don't force a search
+WEB_HINTS_RE = re.compile(r"\b(?:today|news|latest|prices?|weather|scores?|who is|current)\b")
+# Turns that never need the web; anything else is left to the model
+SMALL_TALK = frozenset({
+    "hi", "hii", "hello", "hey", "hey there", "hi there", "hello there", "yo",
+    "good morning", "good afternoon", "good evening", "good night",
+    "thanks", "thank you", "thanks a lot", "thank you so much", "thx", "ty",
+    "ok", "okay", "ok thanks", "okay thanks", "cool", "great", "nice", "got it",
+    "bye", "goodbye", "bye bye", "see you", "see ya",
+})
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+@functools.lru_cache(maxsize=1024)
+def _route_normalized(normalized: str) -> str:
+    if WEB_HINTS_RE.search(normalized):
+        return "WEB"
+    if normalized.strip(" .,!?") in SMALL_TALK:
+        return "CHAT"
+    return "AUTO"
+
+def route_query(query: str) -> str:
+    """
+    Decides if the query may need web access, without an LLM call.
+    Returns 'WEB' if it clearly asks for fresh information, 'CHAT' for
+    greetings, thanks and goodbyes that never do, and 'AUTO' to let the model
+    decide through tool calling.
+    """
+    return _route_normalized(normalize_query(query))
@@ -0,0 +1,43 @@
+import time
+
+from routers.semantic_cache import SemanticResponseCache
+
+
+class FakeDoc:
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+
+class FakeStore:
+    """Stands in for the Chroma collection: every lookup is a near-exact hit."""
+
+    def __init__(self, response, distance=0.01):
+        self.hit = (FakeDoc({"mode": "general", "response": response, "expires_at": time.time() + 3600}), distance)
+        self.added = []
+
+    def similarity_search_with_score(self, query, k=1, filter=None):
+        return [self.hit]
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        self.added.append((texts, metadatas, ids))
+
+
+def test_close_hit_is_served_for_ordinary_prompt():
+    cache = SemanticResponseCache(FakeStore("Glad to hear it!"))
+    assert cache.lookup("general", "I don't want to go outside today") == "Glad to hear it!"
+
+
+def test_self_harm_prompt_close_to_cached_entry_is_not_served():
+    # Cached for "I don't want to kill myself"; the crisis prompt must miss and reach the tool loop
+    cache = SemanticResponseCache(FakeStore("Glad to hear it!"))
+    assert cache.lookup("general", "I want to kill myself") is None
+    assert cache.lookup("general", "thinking about self-harm again") is None
+
+
+def test_crisis_replies_are_never_stored():
+    store = FakeStore("unused")
+    cache = SemanticResponseCache(store)
+    cache.store_response("general", "I might cut myself", "Please reach out...")
+    assert store.added == []
+    cache.store_response("general", "what is a healthy breakfast?", "Oats and fruit.")
+    assert len(store.added) == 1
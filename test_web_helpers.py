@@ -0,0 +1,61 @@
+import asyncio
+import os
+
+os.environ.setdefault("COHERE_API_KEY", "test-key")
+
+import httpx
+
+from routers import web_helpers
+
+ARTICLE = "Paracetamol is usually taken every four to six hours, with no more than four doses a day."
+
+
+def download(monkeypatch, html):
+    """Runs download_page against a mock transport that serves `html`."""
+    def handler(request):
+        return httpx.Response(200, headers={"Content-Type": "text/html; charset=utf-8"}, text=html)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr(web_helpers, "scrape_client", lambda: client)
+            return await web_helpers.download_page("https://example.org/dosing")
+
+    return asyncio.run(run())
+
+
+def test_article_behind_heavy_head_is_downloaded_and_extracted(monkeypatch):
+    script = "<script>var tracker = 'x';</script>\n" * 9000
+    html = (
+        f"<html><head><title>Dosing</title>{script}</head>"
+        f"<body><nav>Home | About</nav><article><h1>Dosing</h1><p>{ARTICLE}</p></article></body></html>"
+    )
+    # Past the old max_chars * 16 byte cut-off
+    assert html.index("<article>") > 128_000
+
+    page = download(monkeypatch, html)
+    assert ARTICLE in page
+    assert ARTICLE in web_helpers.extract_text(page, 8000)
+
+
+def test_download_stops_after_main_content(monkeypatch):
+    footer = "<script>var related = 'y';</script>\n" * 20000
+    html = f"<html><body><article><p>{ARTICLE}</p></article>{footer}<p>FOOTER END</p></body></html>"
+
+    page = download(monkeypatch, html)
+    assert ARTICLE in page
+    assert "FOOTER END" not in page
+    assert len(page) < web_helpers.PAGE_READ_BYTES
+
+
+def test_short_queries_keep_web_search_unless_small_talk():
+    assert web_helpers.route_query("measles outbreak texas") == "AUTO"
+    assert web_helpers.route_query("ozempic shortage update") == "AUTO"
+    assert web_helpers.route_query("Thanks!") == "CHAT"
+    assert web_helpers.route_query("hi there") == "CHAT"
+
+
+def test_web_hints_match_whole_words_only():
+    assert web_helpers.route_query("latest flu guidance") == "WEB"
+    assert web_helpers.route_query("is the clinic open today?") == "WEB"
+    assert web_helpers.route_query("I'm currently taking ibuprofen, is that fine?") == "AUTO"
+    assert web_helpers.route_query("can you make me a newsletter about sleep") == "AUTO"